@@ -1,5 +1,9 @@
 import os
 import json
+import threading
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from fastapi import APIRouter, Response
 from typing import List, TypedDict, Optional, Dict, Literal
 from langchain_openai import ChatOpenAI
@@ -8,6 +12,9 @@ from langchain.tools import Tool
 from langchain.chains import LLMMathChain
 from langchain.prompts import PromptTemplate, ChatPromptTemplate
 from langgraph.graph import END, START, StateGraph
+from app.helpers import speculation
+from app.helpers.state_store import get_state_store
+from app.helpers.tracing import get_request_id, llm_tracing_callback, span, traced_node
 
 genai = APIRouter()
 
@@ -43,11 +50,25 @@ class GraphState(TypedDict):
     ai_confirmation_answer: Optional[bool]
     revision_count: Optional[int]
     message_history: Optional[List[str]]  # Added message_history
+    request_id: Optional[str]
 
 
 MAX_REVISIONS = 5
 
 
+class RevisionLimitExceeded(Exception):
+    """No draft passed review within MAX_REVISIONS revisions."""
+
+
+# Candidate questions drafted in parallel per round, 1 keeps the serial workflow.
+SPECULATIVE_CANDIDATES = int(os.getenv("SPECULATIVE_CANDIDATES", "1"))
+SPECULATIVE_TEMPERATURE = 0.7
+
+KEY_CONCEPTS_CACHE_TTL = 24 * 60 * 60
+# Past questions of the student added to the prompt to avoid repeats.
+STUDENT_HISTORY_LIMIT = 20
+
+
 def get_key_concepts_template():
     template = """List 5 key math concepts for {grade} grade student to understand."""
     return template
@@ -60,18 +81,34 @@ async def ai_chat_get_key_concepts(query: dict) -> Response:
     print("Starting key concepts generation")
     print(f"Input query: {query}")
 
-    OPENAPI_KEY = os.getenv("OPENAI_API_KEY")
-    llm = ChatOpenAI(api_key=OPENAPI_KEY, model="gpt-4", temperature=0.0)
-
     user_dict = json.loads(query["user_dict"])
     grade = user_dict["grade"]
 
+    store = get_state_store()
+    cache_key = f"key_concepts:{grade}"
+    response_dict = store.get_cache(cache_key)
+    if response_dict is not None:
+        print(f"Cached concepts: {response_dict}")
+        output_dict = {
+            "retrieval_response": response_dict,
+        }
+        return Response(json.dumps(output_dict), media_type="application/json")
+
+    OPENAPI_KEY = os.getenv("OPENAI_API_KEY")
+    llm = ChatOpenAI(
+        api_key=OPENAPI_KEY,
+        model="gpt-4",
+        temperature=0.0,
+        callbacks=[llm_tracing_callback],
+    )
+
     math_concepts_template = get_key_concepts_template()
     math_concepts_filled_in = math_concepts_template.format(**{"grade": grade})
 
     structured_llm = llm.with_structured_output(MathConcepts)
     response = structured_llm.invoke(math_concepts_filled_in)
     response_dict = response.dict()
+    store.set_cache(cache_key, response_dict, ttl=KEY_CONCEPTS_CACHE_TTL)
 
     print(f"Generated concepts: {response_dict}")
 
@@ -87,18 +124,20 @@ def get_question_template():
     return template
 
 
-def initial_question_answers(state: GraphState) -> GraphState:
-    print("--------------------")
-    print("Node: initial_question_answers")
-    print(f"Initial state: {state}")
-
+def generate_math_problem(state: GraphState, temperature: float = 0.0) -> MathProblem:
+    """Draft a math problem for the grade and concept in the state."""
     OPENAPI_KEY = os.getenv("OPENAI_API_KEY")
-    llm = ChatOpenAI(api_key=OPENAPI_KEY, model="gpt-4", temperature=0.0)
+    llm = ChatOpenAI(
+        api_key=OPENAPI_KEY,
+        model="gpt-4",
+        temperature=temperature,
+        callbacks=[llm_tracing_callback],
+    )
 
     math_problem_template = get_question_template()
 
     structured_llm = llm.with_structured_output(MathProblem)
-    response = structured_llm.invoke(
+    return structured_llm.invoke(
         math_problem_template.format(
             grade=state["grade"],
             math_concept=state["math_subject"],
@@ -106,6 +145,14 @@ def initial_question_answers(state: GraphState) -> GraphState:
         )
     )
 
+
+def initial_question_answers(state: GraphState) -> GraphState:
+    print("--------------------")
+    print("Node: initial_question_answers")
+    print(f"Initial state: {state}")
+
+    response = generate_math_problem(state)
+
     # Initialize all state fields
     state["initial_question"] = response.problem_name
     state["initial_possible_answers"] = response.multiple_choice
@@ -114,7 +161,10 @@ def initial_question_answers(state: GraphState) -> GraphState:
     state["final_correct_answer"] = None
     state["ai_confirmation_question"] = None
     state["ai_confirmation_answer"] = None
-    state["revision_count"] = 0
+    # Keep counting across loops so the traces see the real revision number
+    # and check_revision_limit can stop a question that keeps failing.
+    if state.get("revision_count") is None:
+        state["revision_count"] = 0
 
     # Initialize or update message history
     if state.get("message_history") is None:
@@ -138,7 +188,12 @@ def review_question(state: GraphState) -> GraphState:
     print(f"Current state: {state}")
 
     OPENAPI_KEY = os.getenv("OPENAI_API_KEY")
-    llm = ChatOpenAI(api_key=OPENAPI_KEY, model="gpt-4", temperature=0.0)
+    llm = ChatOpenAI(
+        api_key=OPENAPI_KEY,
+        model="gpt-4",
+        temperature=0.0,
+        callbacks=[llm_tracing_callback],
+    )
 
     if state["revision_count"] >= MAX_REVISIONS:
         print("Max revisions reached")
@@ -206,7 +261,12 @@ If not, explain what's missing or unclear.""",
 
 def validate_question_with_langgraph(question_answers_dict: dict):
     OPENAPI_KEY = os.getenv("OPENAI_API_KEY")
-    llm = ChatOpenAI(api_key=OPENAPI_KEY, model="gpt-4", temperature=0.0)
+    llm = ChatOpenAI(
+        api_key=OPENAPI_KEY,
+        model="gpt-4",
+        temperature=0.0,
+        callbacks=[llm_tracing_callback],
+    )
 
     try:
         question = question_answers_dict["problem_name"]
@@ -323,11 +383,22 @@ def review_answer(state: GraphState) -> GraphState:
     return state
 
 
+def check_revision_limit(state: GraphState):
+    """Fail the workflow rather than serve a draft that never passed review."""
+    if state["revision_count"] >= MAX_REVISIONS:
+        print("Max revisions reached without a validated question")
+        raise RevisionLimitExceeded(
+            f"No validated question after {state['revision_count']} revisions"
+        )
+
+
 def review_question_decision(
     state: GraphState,
 ) -> Literal["review_answer", "initial_question_answers"]:
     print("\n--------------------")
     print("Decision: review_question_decision")
+    if not state["ai_confirmation_question"]:
+        check_revision_limit(state)
     decision = (
         "review_answer"
         if state["ai_confirmation_question"]
@@ -342,6 +413,8 @@ def review_answer_decision(
 ) -> Literal["summarize_output", "initial_question_answers"]:
     print("\n--------------------")
     print("Decision: review_answer_decision")
+    if not state["ai_confirmation_answer"]:
+        check_revision_limit(state)
     decision = (
         "summarize_output"
         if state["ai_confirmation_answer"]
@@ -384,14 +457,188 @@ def summarize_output(state: GraphState) -> Dict:
     }
 
 
+def run_speculative_candidate(
+    state: GraphState, index: int, winner_found: threading.Event
+) -> dict:
+    """Draft, review and validate one candidate on its own copy of the state.
+
+    Once another candidate has passed, the remaining review calls are skipped.
+    Candidate 0 always finishes: it is the serial workflow's draft, so its calls
+    are spent either way and its outcome tells whether a round was saved.
+    """
+    candidate = dict(state)
+    candidate["message_history"] = list(state.get("message_history") or [])
+    candidate["llm_calls"] = 0
+    candidate["candidate_index"] = index
+    candidate["stopped_early"] = False
+    candidate["ai_confirmation_question"] = False
+    candidate["ai_confirmation_answer"] = False
+
+    # The first candidate matches the serial workflow, the rest are sampled
+    # so the drafts differ from each other.
+    temperature = 0.0 if index == 0 else SPECULATIVE_TEMPERATURE
+    with span("speculative_candidate", candidate=index):
+        try:
+            response = generate_math_problem(state, temperature=temperature)
+        except Exception as e:
+            candidate["message_history"].append(f"Candidate {index} failed: {e}")
+            return candidate
+        finally:
+            candidate["llm_calls"] += 1
+
+        candidate["initial_question"] = response.problem_name
+        candidate["initial_possible_answers"] = response.multiple_choice
+        candidate["final_question"] = None
+        candidate["final_possible_answers"] = None
+        candidate["final_correct_answer"] = None
+        candidate["message_history"].append(
+            f"Generated Question (candidate {index}): {response.problem_name}\n"
+            + f"Generated Answers: {response.multiple_choice}"
+        )
+
+        stop_early = index != 0
+        if stop_early and winner_found.is_set():
+            candidate["stopped_early"] = True
+            return candidate
+        candidate = traced_node(review_question)(candidate)
+        candidate["llm_calls"] += 1
+        if candidate["ai_confirmation_question"]:
+            if stop_early and winner_found.is_set():
+                candidate["stopped_early"] = True
+                return candidate
+            candidate = traced_node(review_answer)(candidate)
+            candidate["llm_calls"] += 1
+    return candidate
+
+
+def _collect_leftover(future, winner_calls: Optional[int]):
+    if future.cancelled() or future.exception() is not None:
+        return
+    speculation.record_leftover(get_state_store(), future.result(), winner_calls)
+
+
+def speculative_question_answers(state: GraphState) -> GraphState:
+    """Race several candidates through review and keep the first that passes."""
+    print("--------------------")
+    print("Node: speculative_question_answers")
+    print(f"Current state: {state}")
+
+    if state.get("message_history") is None:
+        state["message_history"] = []
+    if state.get("revision_count") is None:
+        state["revision_count"] = 0
+
+    winner_found = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=SPECULATIVE_CANDIDATES)
+    futures = {
+        executor.submit(
+            contextvars.copy_context().run,
+            run_speculative_candidate,
+            state,
+            index,
+            winner_found,
+        ): index
+        for index in range(SPECULATIVE_CANDIDATES)
+    }
+
+    winner_future = None
+    for future in as_completed(futures):
+        if future.exception() is not None:
+            print(f"Candidate {futures[future]} failed: {future.exception()}")
+            continue
+        if speculation.candidate_passed(future.result()):
+            winner_future = future
+            break
+    # Every candidate is already running, so losing ones (other than the serial
+    # draft) are stopped through the event before their next review call.
+    winner_found.set()
+    executor.shutdown(wait=False)
+
+    winner = winner_future.result() if winner_future is not None else None
+    winner_calls = winner["llm_calls"] if winner is not None else None
+    speculation.record_round(get_state_store(), SPECULATIVE_CANDIDATES, winner)
+    for future in futures:
+        if future is not winner_future:
+            future.add_done_callback(
+                functools.partial(_collect_leftover, winner_calls=winner_calls)
+            )
+
+    if winner is None:
+        # No draft from this round is kept, so a failed question can never
+        # reach the output.
+        state["revision_count"] += 1
+        state["ai_confirmation_question"] = False
+        state["ai_confirmation_answer"] = False
+        state["message_history"].append(
+            f"No candidate out of {SPECULATIVE_CANDIDATES} passed. Requesting revision."
+        )
+        print(f"No candidate passed, revision count: {state['revision_count']}")
+        return state
+
+    for key in (
+        "initial_question",
+        "initial_possible_answers",
+        "final_question",
+        "final_possible_answers",
+        "final_correct_answer",
+        "ai_confirmation_question",
+        "ai_confirmation_answer",
+        "message_history",
+    ):
+        state[key] = winner[key]
+    print(f"Candidate {futures[winner_future]} passed first")
+    return state
+
+
+def speculative_decision(
+    state: GraphState,
+) -> Literal["summarize_output", "speculative_question_answers"]:
+    print("\n--------------------")
+    print("Decision: speculative_decision")
+    if not state["ai_confirmation_answer"]:
+        check_revision_limit(state)
+    decision = (
+        "summarize_output"
+        if state["ai_confirmation_answer"]
+        else "speculative_question_answers"
+    )
+    print(f"Decision result: {decision}")
+    return decision
+
+
+def create_speculative_question_workflow():
+    """Create the workflow that races candidates instead of revising serially."""
+    workflow = StateGraph(GraphState)
+
+    workflow.add_node(
+        "speculative_question_answers", traced_node(speculative_question_answers)
+    )
+    workflow.add_node("summarize_output", traced_node(summarize_output))
+
+    workflow.set_entry_point("speculative_question_answers")
+    workflow.add_conditional_edges(
+        source="speculative_question_answers",
+        path=speculative_decision,
+        path_map={
+            "summarize_output": "summarize_output",
+            "speculative_question_answers": "speculative_question_answers",
+        },
+    )
+    workflow.add_edge("summarize_output", END)
+
+    return workflow.compile()
+
+
 def create_question_workflow():
     """Create and configure the workflow with proper state handling."""
     workflow = StateGraph(GraphState)
 
-    workflow.add_node("initial_question_answers", initial_question_answers)
-    workflow.add_node("review_question", review_question)
-    workflow.add_node("review_answer", review_answer)
-    workflow.add_node("summarize_output", summarize_output)
+    workflow.add_node(
+        "initial_question_answers", traced_node(initial_question_answers)
+    )
+    workflow.add_node("review_question", traced_node(review_question))
+    workflow.add_node("review_answer", traced_node(review_answer))
+    workflow.add_node("summarize_output", traced_node(summarize_output))
 
     workflow.set_entry_point("initial_question_answers")
     workflow.add_edge("initial_question_answers", "review_question")
@@ -430,15 +677,72 @@ async def ai_chat_agent_get_question(query: dict) -> Response:
     user_dict = json.loads(query["user_dict"])
     math_info_dict = json.loads(query["math_info"])
 
-    app = create_question_workflow()
+    # Merge the stored history so questions are not repeated across sessions,
+    # workers and restarts.
+    store = get_state_store()
+    student = user_dict.get("user", "test_user")
+    stored_history = [
+        record["question"]
+        for record in store.history(
+            student=student,
+            grade=user_dict["grade"],
+            concept=math_info_dict["concept_name"],
+            limit=STUDENT_HISTORY_LIMIT,
+        )
+    ]
+    question_history = question_history + [
+        question for question in stored_history if question not in question_history
+    ]
+
+    pooled = None
+    if SPECULATIVE_CANDIDATES > 1:
+        app = create_speculative_question_workflow()
+        pooled = speculation.take_pooled(
+            store, user_dict["grade"], math_info_dict["concept_name"], question_history
+        )
+    else:
+        app = create_question_workflow()
 
-    result = app.invoke(
-        {
-            "grade": user_dict["grade"],
-            "question_history": question_history,
-            "math_subject": math_info_dict["concept_name"],
-        }
-    )
+    try:
+        with span(
+            "question_workflow",
+            grade=user_dict["grade"],
+            math_subject=math_info_dict["concept_name"],
+            pooled=pooled is not None,
+        ) as attributes:
+            if pooled is not None:
+                result = pooled
+            else:
+                result = app.invoke(
+                    {
+                        "grade": user_dict["grade"],
+                        "question_history": question_history,
+                        "math_subject": math_info_dict["concept_name"],
+                        "request_id": get_request_id(),
+                    }
+                )
+            attributes["revision_count"] = result.get("revision_count", 0)
+    except RevisionLimitExceeded as e:
+        print(f"Workflow failed: {e}")
+        return Response(
+            json.dumps({"error": str(e)}),
+            status_code=503,
+            media_type="application/json",
+        )
+
+    # Only validated questions become part of the student's history.
+    if result.get("ai_confirmation_answer") and result.get("final_correct_answer"):
+        store.record_history(
+            student,
+            user_dict["grade"],
+            math_info_dict["concept_name"],
+            result["final_question"],
+            {
+                "multiple_choice": result.get("final_possible_answers", []),
+                "answer": result.get("final_correct_answer", ""),
+                "revision_count": result.get("revision_count", 0),
+            },
+        )
 
     print("\n====================")
     print("Workflow completed")
@@ -467,3 +771,48 @@ async def ai_chat_agent_get_question(query: dict) -> Response:
     }
 
     return Response(json.dumps(output_dict), media_type="application/json")
+
+
+@genai.get("/speculation_stats/")
+async def speculation_stats() -> Response:
+    """Wasted versus saved model calls of speculative generation.
+
+    Counters are shared by all workers, see app.helpers.speculation for what
+    each one counts.
+    """
+    stats = speculation.speculation_stats(get_state_store())
+    stats["speculative_candidates"] = SPECULATIVE_CANDIDATES
+    return Response(json.dumps(stats), media_type="application/json")
+
+
+@genai.post("/record_answer/")
+async def record_answer(query: dict) -> Response:
+    """Record whether the student answered a question correctly."""
+    user_dict = json.loads(query["user_dict"])
+    math_info_dict = json.loads(query["math_info"])
+    answer_dict = json.loads(query["answer"])
+
+    student = user_dict.get("user", "test_user")
+    correct = str(answer_dict["selected_answer"]) == str(answer_dict["correct_answer"])
+
+    store = get_state_store()
+    store.record_answer(
+        student,
+        user_dict["grade"],
+        math_info_dict["concept_name"],
+        answer_dict["question"],
+        answer_dict["selected_answer"],
+        correct,
+    )
+    answers = store.answers(
+        student=student,
+        grade=user_dict["grade"],
+        concept=math_info_dict["concept_name"],
+    )
+
+    output_dict = {
+        "correct": correct,
+        "answered": len(answers),
+        "answered_correctly": sum(a["payload"]["correct"] for a in answers),
+    }
+    return Response(json.dumps(output_dict), media_type="application/json")
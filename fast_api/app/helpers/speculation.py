@@ -0,0 +1,121 @@
+"""Bookkeeping for speculative question generation.
+
+Counters live in the state store so every worker reports the same totals. They
+compare speculation with the serial workflow, which only ever drafts
+candidate 0:
+
+- ``rounds``, ``candidates``: speculative rounds run and candidates drafted.
+- ``llm_calls``: every model call made by any candidate.
+- ``used_calls``: calls of the candidates that won their round.
+- ``wasted_calls``: calls of losing candidates other than candidate 0. The
+  serial workflow makes candidate 0's calls anyway, so they are never waste.
+  Candidates kept in the pool count as waste here and are credited back
+  through ``saved_calls`` when they are served.
+- ``stopped_early``: losing candidates that skipped their remaining review
+  calls because another candidate had already passed.
+- ``pooled``, ``pool_hits``: late passing candidates kept in the question pool,
+  and requests served from it without running the workflow.
+- ``saved_rounds``, ``saved_calls``: rounds the serial workflow would have had
+  to add. A round is saved when another candidate won and candidate 0 failed,
+  and on every pool hit. ``saved_calls`` adds the winner's calls for the first
+  case and ``PASSING_ROUND_CALLS`` for a pool hit.
+"""
+from typing import List, Optional
+from app.helpers.state_store import StateStore
+
+# generate, review_question and review_answer
+PASSING_ROUND_CALLS = 3
+
+COUNTERS = (
+    "rounds",
+    "candidates",
+    "stopped_early",
+    "llm_calls",
+    "used_calls",
+    "wasted_calls",
+    "pooled",
+    "pool_hits",
+    "saved_rounds",
+    "saved_calls",
+)
+# Fields of a validated candidate kept in the question pool, as produced by
+# summarize_output minus the requester's history and revision count.
+POOLED_FIELDS = (
+    "final_question",
+    "final_possible_answers",
+    "final_correct_answer",
+    "initial_question",
+    "initial_possible_answers",
+    "ai_confirmation_question",
+    "ai_confirmation_answer",
+    "grade",
+    "math_subject",
+)
+
+
+def count(store: StateStore, name: str, amount: int = 1):
+    store.increment(f"speculation.{name}", amount)
+
+
+def candidate_passed(candidate: dict) -> bool:
+    return bool(
+        candidate.get("ai_confirmation_question")
+        and candidate.get("ai_confirmation_answer")
+    )
+
+
+def record_round(store: StateStore, candidates: int, winner: Optional[dict]):
+    """Count a finished round and the calls of its winner, if any."""
+    count(store, "rounds")
+    count(store, "candidates", candidates)
+    if winner is not None:
+        count(store, "llm_calls", winner["llm_calls"])
+        count(store, "used_calls", winner["llm_calls"])
+
+
+def record_leftover(store: StateStore, candidate: dict, winner_calls: Optional[int]):
+    """Account for a candidate that did not win, pooling it if it passed.
+
+    ``winner_calls`` is the call count of the round's winner, or None when no
+    candidate passed.
+    """
+    passed = candidate_passed(candidate)
+    is_serial_draft = candidate["candidate_index"] == 0
+    count(store, "llm_calls", candidate["llm_calls"])
+    if candidate["stopped_early"]:
+        count(store, "stopped_early")
+    if not is_serial_draft:
+        count(store, "wasted_calls", candidate["llm_calls"])
+    if is_serial_draft and not passed and winner_calls is not None:
+        count(store, "saved_rounds")
+        count(store, "saved_calls", winner_calls)
+    if passed:
+        count(store, "pooled")
+        store.push_pool(
+            candidate["grade"],
+            candidate["math_subject"],
+            candidate["final_question"],
+            {key: candidate.get(key) for key in POOLED_FIELDS},
+        )
+
+
+def take_pooled(
+    store: StateStore, grade: str, math_subject: str, question_history: List[str]
+) -> Optional[dict]:
+    """Return a pooled question the student has not seen, with a fresh history."""
+    candidate = store.pop_pool(grade, math_subject, exclude=question_history)
+    if candidate is None:
+        return None
+    count(store, "pool_hits")
+    count(store, "saved_rounds")
+    count(store, "saved_calls", PASSING_ROUND_CALLS)
+    candidate["revision_count"] = 0
+    candidate["message_history"] = ["Served from the question pool."]
+    return candidate
+
+
+def speculation_stats(store: StateStore) -> dict:
+    counters = store.counters()
+    stats = {name: counters.get(f"speculation.{name}", 0) for name in COUNTERS}
+    stats["pool_size"] = store.pool_size()
+    return stats
@@ -0,0 +1,416 @@
+"""Shared state for caches, the question pool and student progress.
+
+Every gunicorn worker builds its own store, so the in-memory backend is only
+useful for a single process. The SQLite backend keeps the data in one WAL mode
+database file that all workers read and write concurrently, and that survives
+restarts. The backend is picked with ``STATE_BACKEND`` (``sqlite`` or
+``memory``) and the database location with ``STATE_DB_PATH``.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional
+from collections import defaultdict
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state/state.db")
+
+
+class StateStore(ABC):
+    """Interface shared by the state backends."""
+
+    @abstractmethod
+    def record_history(
+        self, student: str, grade: str, concept: str, question: str, payload: dict
+    ):
+        raise NotImplementedError
+
+    @abstractmethod
+    def history(
+        self,
+        student: Optional[str] = None,
+        grade: Optional[str] = None,
+        concept: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]:
+        """Return history records matching the filters, newest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_answer(
+        self,
+        student: str,
+        grade: str,
+        concept: str,
+        question: str,
+        answer: str,
+        correct: bool,
+    ):
+        raise NotImplementedError
+
+    @abstractmethod
+    def answers(
+        self,
+        student: Optional[str] = None,
+        grade: Optional[str] = None,
+        concept: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]:
+        """Return answer records matching the filters, newest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def push_pool(self, grade: str, concept: str, question: str, payload: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def pop_pool(self, grade: str, concept: str, exclude: List[str] = ()):
+        """Remove and return the oldest pooled payload not in ``exclude``."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def pool_size(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_cache(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_cache(self, key: str, value, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def increment(self, name: str, amount: int = 1):
+        """Add ``amount`` to the named counter."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def counters(self) -> dict:
+        raise NotImplementedError
+
+
+class _IndexedRecords:
+    """Student records indexed by student, (grade, concept) and grade."""
+
+    def __init__(self):
+        self._next_id = 0
+        self._by_student = defaultdict(list)
+        self._by_grade_concept = defaultdict(list)
+        self._by_grade = defaultdict(list)
+        self._all = []
+
+    def add(self, student, grade, concept, question, payload):
+        self._next_id += 1
+        record = {
+            "id": self._next_id,
+            "student": student,
+            "grade": grade,
+            "concept": concept,
+            "question": question,
+            "payload": payload,
+            "created": time.time(),
+        }
+        self._all.append(record)
+        self._by_student[student].append(record)
+        self._by_grade_concept[(grade, concept)].append(record)
+        self._by_grade[grade].append(record)
+
+    def find(self, student=None, grade=None, concept=None, limit=None):
+        if student is not None:
+            records = self._by_student.get(student, [])
+        elif grade is not None and concept is not None:
+            records = self._by_grade_concept.get((grade, concept), [])
+        elif grade is not None:
+            records = self._by_grade.get(grade, [])
+        else:
+            records = self._all
+        matches = [
+            r
+            for r in reversed(records)
+            if (grade is None or r["grade"] == grade)
+            and (concept is None or r["concept"] == concept)
+        ]
+        return matches[:limit] if limit else matches
+
+
+class InMemoryStateStore(StateStore):
+    """Process local store, indexed by student and by (grade, concept)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = _IndexedRecords()
+        self._answers = _IndexedRecords()
+        self._pool = defaultdict(list)
+        self._cache = {}
+        self._counters = defaultdict(int)
+
+    def record_history(self, student, grade, concept, question, payload):
+        with self._lock:
+            self._history.add(student, grade, concept, question, payload)
+
+    def history(self, student=None, grade=None, concept=None, limit=None):
+        with self._lock:
+            return self._history.find(student, grade, concept, limit)
+
+    def record_answer(self, student, grade, concept, question, answer, correct):
+        payload = {"answer": answer, "correct": correct}
+        with self._lock:
+            self._answers.add(student, grade, concept, question, payload)
+
+    def answers(self, student=None, grade=None, concept=None, limit=None):
+        with self._lock:
+            return self._answers.find(student, grade, concept, limit)
+
+    def push_pool(self, grade, concept, question, payload):
+        with self._lock:
+            self._pool[(grade, concept)].append((question, payload))
+
+    def pop_pool(self, grade, concept, exclude=()):
+        with self._lock:
+            pool = self._pool.get((grade, concept), [])
+            for i, (question, payload) in enumerate(pool):
+                if question not in exclude:
+                    del pool[i]
+                    return payload
+        return None
+
+    def pool_size(self):
+        with self._lock:
+            return sum(len(pool) for pool in self._pool.values())
+
+    def get_cache(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self._cache[key]
+                return None
+            return value
+
+    def set_cache(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._cache[key] = (value, expires)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class SQLiteStateStore(StateStore):
+    """Store shared by every process on the host through one WAL database."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS student_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student TEXT NOT NULL,
+        grade TEXT,
+        concept TEXT,
+        question TEXT,
+        payload TEXT,
+        created REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_history_student
+        ON student_history (student, grade, concept);
+    CREATE INDEX IF NOT EXISTS idx_history_grade_concept
+        ON student_history (grade, concept);
+    CREATE TABLE IF NOT EXISTS student_answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student TEXT NOT NULL,
+        grade TEXT,
+        concept TEXT,
+        question TEXT,
+        payload TEXT,
+        created REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_answers_student
+        ON student_answers (student, grade, concept);
+    CREATE INDEX IF NOT EXISTS idx_answers_grade_concept
+        ON student_answers (grade, concept);
+    CREATE TABLE IF NOT EXISTS question_pool (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        grade TEXT,
+        concept TEXT,
+        question TEXT,
+        payload TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_pool_grade_concept
+        ON question_pool (grade, concept);
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        expires REAL
+    );
+    CREATE TABLE IF NOT EXISTS stats (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _add_record(self, table, student, grade, concept, question, payload):
+        self._connection().execute(
+            f"INSERT INTO {table}"
+            " (student, grade, concept, question, payload, created)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                student,
+                grade,
+                concept,
+                question,
+                json.dumps(payload, default=str),
+                time.time(),
+            ),
+        )
+
+    def _find_records(self, table, student, grade, concept, limit):
+        clauses, params = [], []
+        for column, value in (
+            ("student", student),
+            ("grade", grade),
+            ("concept", concept),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        sql = (
+            "SELECT id, student, grade, concept, question, payload, created"
+            f" FROM {table}"
+        )
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(sql, params).fetchall()
+        return [
+            {
+                "id": row[0],
+                "student": row[1],
+                "grade": row[2],
+                "concept": row[3],
+                "question": row[4],
+                "payload": json.loads(row[5]),
+                "created": row[6],
+            }
+            for row in rows
+        ]
+
+    def record_history(self, student, grade, concept, question, payload):
+        self._add_record("student_history", student, grade, concept, question, payload)
+
+    def history(self, student=None, grade=None, concept=None, limit=None):
+        return self._find_records("student_history", student, grade, concept, limit)
+
+    def record_answer(self, student, grade, concept, question, answer, correct):
+        payload = {"answer": answer, "correct": correct}
+        self._add_record("student_answers", student, grade, concept, question, payload)
+
+    def answers(self, student=None, grade=None, concept=None, limit=None):
+        return self._find_records("student_answers", student, grade, concept, limit)
+
+    def push_pool(self, grade, concept, question, payload):
+        self._connection().execute(
+            "INSERT INTO question_pool (grade, concept, question, payload)"
+            " VALUES (?, ?, ?, ?)",
+            (grade, concept, question, json.dumps(payload, default=str)),
+        )
+
+    def pop_pool(self, grade, concept, exclude=()):
+        connection = self._connection()
+        # Take the write lock up front so two workers cannot pop the same row.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, question, payload FROM question_pool"
+                " WHERE grade = ? AND concept = ? ORDER BY id",
+                (grade, concept),
+            ).fetchall()
+            for row_id, question, payload in rows:
+                if question not in exclude:
+                    connection.execute(
+                        "DELETE FROM question_pool WHERE id = ?", (row_id,)
+                    )
+                    connection.execute("COMMIT")
+                    return json.loads(payload)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return None
+
+    def pool_size(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM question_pool"
+        ).fetchone()[0]
+
+    def get_cache(self, key):
+        row = self._connection().execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set_cache(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=str), expires),
+        )
+
+    def increment(self, name, amount=1):
+        self._connection().execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def counters(self):
+        rows = self._connection().execute("SELECT name, value FROM stats").fetchall()
+        return dict(rows)
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Return this process's store for the configured backend."""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            if STATE_BACKEND == "memory":
+                _state_store = InMemoryStateStore()
+            elif STATE_BACKEND == "sqlite":
+                _state_store = SQLiteStateStore(STATE_DB_PATH)
+            else:
+                raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+        return _state_store
@@ -0,0 +1,93 @@
+"""Compare read/write latency of the state backends.
+
+    python -m app.helpers.state_store_benchmark [operations]
+"""
+import os
+import sys
+import time
+import tempfile
+from app.helpers.state_store import InMemoryStateStore, SQLiteStateStore
+
+GRADES = ["K", "1", "2", "3", "4", "5"]
+CONCEPTS = ["Addition", "Subtraction", "Fractions", "Geometry"]
+STUDENTS = [f"student_{i}" for i in range(50)]
+
+
+def timed(fn, operations: int) -> float:
+    """Run fn(i) for each operation and return the mean latency in microseconds."""
+    start = time.perf_counter()
+    for i in range(operations):
+        fn(i)
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def benchmark(store, operations: int) -> dict:
+    payload = {"multiple_choice": ["1", "2", "3", "4"], "answer": "2"}
+
+    def record_history(i):
+        store.record_history(
+            STUDENTS[i % len(STUDENTS)],
+            GRADES[i % len(GRADES)],
+            CONCEPTS[i % len(CONCEPTS)],
+            f"question {i}",
+            payload,
+        )
+
+    def push_pool(i):
+        store.push_pool(
+            GRADES[i % len(GRADES)], CONCEPTS[i % len(CONCEPTS)], f"pool {i}", payload
+        )
+
+    return {
+        "record_history": timed(record_history, operations),
+        "history_by_student": timed(
+            lambda i: store.history(student=STUDENTS[i % len(STUDENTS)], limit=20),
+            operations,
+        ),
+        "history_by_grade_concept": timed(
+            lambda i: store.history(
+                grade=GRADES[i % len(GRADES)],
+                concept=CONCEPTS[i % len(CONCEPTS)],
+                limit=20,
+            ),
+            operations,
+        ),
+        "set_cache": timed(
+            lambda i: store.set_cache(f"key {i % 100}", payload), operations
+        ),
+        "get_cache": timed(lambda i: store.get_cache(f"key {i % 100}"), operations),
+        "increment": timed(
+            lambda i: store.increment(f"counter {i % 10}"), operations
+        ),
+        "push_pool": timed(push_pool, operations),
+        "pop_pool": timed(
+            lambda i: store.pop_pool(
+                GRADES[i % len(GRADES)], CONCEPTS[i % len(CONCEPTS)]
+            ),
+            operations,
+        ),
+    }
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "memory": benchmark(InMemoryStateStore(), operations),
+            "sqlite": benchmark(
+                SQLiteStateStore(os.path.join(directory, "state.db")), operations
+            ),
+        }
+
+    print(f"Mean latency in microseconds over {operations} operations")
+    print(f"{'operation':<26}{'memory':>12}{'sqlite':>12}")
+    for operation in results["memory"]:
+        print(
+            f"{operation:<26}"
+            f"{results['memory'][operation]:>12.1f}"
+            f"{results['sqlite'][operation]:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
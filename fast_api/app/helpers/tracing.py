@@ -0,0 +1,236 @@
+"""Per-request tracing.
+
+A request id is taken from the ``X-Request-ID`` header sent by the Streamlit
+client (or generated when missing) and attached to every span recorded while
+handling the request: the HTTP endpoint, each StateGraph node and each model
+call. Finished spans are appended as JSON lines to ``TRACE_EXPORT_PATH`` and
+can be viewed offline with::
+
+    python -m app.helpers.tracing traces/spans.jsonl [request_id]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from typing import List
+from collections import defaultdict
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+REQUEST_ID_HEADER = "X-Request-ID"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "traces/spans.jsonl")
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_revision = contextvars.ContextVar("revision", default=None)
+_export_lock = threading.Lock()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def set_request_id(request_id: str):
+    """Set the request id for the current context, returns a reset token."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def export_span(record: dict):
+    """Append a finished span to the trace file. An empty path disables export."""
+    if not TRACE_EXPORT_PATH:
+        return
+    line = json.dumps(record, default=str)
+    with _export_lock:
+        directory = os.path.dirname(TRACE_EXPORT_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(TRACE_EXPORT_PATH, "a") as f:
+            f.write(line + "\n")
+
+
+def _build_record(name, span_id, parent_id, request_id, start, attributes, error):
+    return {
+        "trace_id": request_id,
+        "span_id": span_id,
+        "parent_id": parent_id,
+        "name": name,
+        "start": start,
+        "duration_ms": round((time.time() - start) * 1000, 2),
+        "attributes": attributes,
+        "error": error,
+        "pid": os.getpid(),
+    }
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a span around a block, yields the attributes dict for updates."""
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _current_span.get()
+    revision = _revision.get()
+    if revision is not None:
+        attributes.setdefault("revision", revision)
+    token = _current_span.set(span_id)
+    start = time.time()
+    error = None
+    try:
+        yield attributes
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        export_span(
+            _build_record(
+                name, span_id, parent_id, get_request_id(), start, attributes, error
+            )
+        )
+
+
+def traced_node(node):
+    """Wrap a StateGraph node so each execution is recorded as a span.
+
+    The request id is also read from the graph state, so spans stay attached to
+    the request when LangGraph runs the node outside the endpoint's context.
+    """
+
+    @functools.wraps(node)
+    def wrapper(state):
+        request_token = None
+        if get_request_id() is None and state.get("request_id"):
+            request_token = set_request_id(state["request_id"])
+        revision_token = _revision.set(state.get("revision_count") or 0)
+        try:
+            with span(f"node.{node.__name__}") as attributes:
+                result = node(state)
+                attributes["revision_out"] = result.get("revision_count")
+            return result
+        finally:
+            _revision.reset(revision_token)
+            if request_token is not None:
+                reset_request_id(request_token)
+
+    return wrapper
+
+
+class LLMTracingCallback(BaseCallbackHandler):
+    """LangChain callback that records each model call as a span."""
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        attributes = {"model": params.get("model_name") or params.get("model")}
+        revision = _revision.get()
+        if revision is not None:
+            attributes["revision"] = revision
+        with self._lock:
+            self._runs[run_id] = {
+                "span_id": uuid.uuid4().hex[:16],
+                "parent_id": _current_span.get(),
+                "request_id": get_request_id(),
+                "start": time.time(),
+                "attributes": attributes,
+            }
+
+    def _end(self, run_id, error=None, token_usage=None):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        attributes = run["attributes"]
+        if token_usage:
+            attributes["prompt_tokens"] = token_usage.get("prompt_tokens")
+            attributes["completion_tokens"] = token_usage.get("completion_tokens")
+            attributes["total_tokens"] = token_usage.get("total_tokens")
+        export_span(
+            _build_record(
+                "llm.call",
+                run["span_id"],
+                run["parent_id"],
+                run["request_id"],
+                run["start"],
+                attributes,
+                error,
+            )
+        )
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        token_usage = (response.llm_output or {}).get("token_usage")
+        self._end(run_id, token_usage=token_usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=repr(error))
+
+
+llm_tracing_callback = LLMTracingCallback()
+
+
+def load_spans(paths: List[str]) -> dict:
+    """Read span files and group the spans by request id."""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    traces[record.get("trace_id")].append(record)
+    return traces
+
+
+def format_trace(spans: List[dict]) -> str:
+    """Render the spans of one request as an indented tree."""
+    children = defaultdict(list)
+    span_ids = {s["span_id"] for s in spans}
+    for s in sorted(spans, key=lambda s: s["start"]):
+        parent = s["parent_id"] if s["parent_id"] in span_ids else None
+        children[parent].append(s)
+
+    lines = []
+
+    def render(parent, depth):
+        for s in children[parent]:
+            attributes = " ".join(
+                f"{k}={v}" for k, v in s["attributes"].items() if v is not None
+            )
+            error = f" ERROR {s['error']}" if s.get("error") else ""
+            lines.append(
+                f"{'  ' * depth}{s['name']} {s['duration_ms']:.0f}ms {attributes}{error}"
+            )
+            render(s["span_id"], depth + 1)
+
+    render(None, 0)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m app.helpers.tracing <spans.jsonl>... [request_id]")
+        sys.exit(1)
+    files = [arg for arg in sys.argv[1:] if os.path.exists(arg)]
+    wanted = [arg for arg in sys.argv[1:] if not os.path.exists(arg)]
+    for request_id, spans in load_spans(files).items():
+        if wanted and request_id not in wanted:
+            continue
+        print(f"==================== request {request_id}")
+        print(format_trace(spans))
@@ -1,11 +1,19 @@
 from fastapi import (
     FastAPI,
+    Request,
 )
 import sys
 
 sys.path.append("fast_api")
 
 from app.api.genai import genai
+from app.helpers.tracing import (
+    REQUEST_ID_HEADER,
+    new_request_id,
+    reset_request_id,
+    set_request_id,
+    span,
+)
 
 app = FastAPI(
     title="AI Math Tutor",
@@ -13,6 +21,22 @@ app = FastAPI(
     description="AI Math Tutor API using FastAPI and OpenAI.",
 )
 
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Attach the client's request id to every span recorded for this request."""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+    token = set_request_id(request_id)
+    try:
+        with span(f"{request.method} {request.url.path}") as attributes:
+            response = await call_next(request)
+            attributes["status_code"] = response.status_code
+    finally:
+        reset_request_id(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+
 app.include_router(
     genai,
     prefix="/v1/genai",
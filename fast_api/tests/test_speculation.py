@@ -0,0 +1,88 @@
+from app.helpers import speculation
+from app.helpers.state_store import InMemoryStateStore
+
+
+def make_candidate(index, passed, llm_calls=3, stopped_early=False):
+    return {
+        "candidate_index": index,
+        "llm_calls": llm_calls,
+        "stopped_early": stopped_early,
+        "ai_confirmation_question": passed,
+        "ai_confirmation_answer": passed,
+        "final_question": f"question {index}" if passed else None,
+        "final_possible_answers": ["1", "2", "3", "4"],
+        "final_correct_answer": "2" if passed else None,
+        "initial_question": f"question {index}",
+        "initial_possible_answers": ["1", "2", "3", "4"],
+        "grade": "3",
+        "math_subject": "Fractions",
+        "request_id": "someone else's request",
+        "question_history": ["old question"],
+        "message_history": ["someone else's history"],
+        "revision_count": 2,
+    }
+
+
+def test_winner_other_than_serial_draft_saves_a_round():
+    store = InMemoryStateStore()
+    winner = make_candidate(1, passed=True)
+    speculation.record_round(store, 3, winner)
+    speculation.record_leftover(store, make_candidate(0, passed=False), 3)
+    speculation.record_leftover(
+        store, make_candidate(2, passed=False, llm_calls=1, stopped_early=True), 3
+    )
+
+    stats = speculation.speculation_stats(store)
+    assert stats["rounds"] == 1
+    assert stats["candidates"] == 3
+    assert stats["used_calls"] == 3
+    assert stats["llm_calls"] == 7
+    # Candidate 0's calls are made by the serial workflow too.
+    assert stats["wasted_calls"] == 1
+    assert stats["stopped_early"] == 1
+    assert stats["saved_rounds"] == 1
+    assert stats["saved_calls"] == 3
+
+
+def test_serial_draft_passing_late_saves_nothing_and_is_pooled():
+    store = InMemoryStateStore()
+    speculation.record_round(store, 2, make_candidate(1, passed=True))
+    speculation.record_leftover(store, make_candidate(0, passed=True), 3)
+
+    stats = speculation.speculation_stats(store)
+    assert stats["saved_rounds"] == 0
+    assert stats["wasted_calls"] == 0
+    assert stats["pooled"] == 1
+    assert stats["pool_size"] == 1
+
+
+def test_round_without_winner_only_wastes_extra_candidates():
+    store = InMemoryStateStore()
+    speculation.record_round(store, 2, None)
+    speculation.record_leftover(store, make_candidate(0, passed=False), None)
+    speculation.record_leftover(store, make_candidate(1, passed=False), None)
+
+    stats = speculation.speculation_stats(store)
+    assert stats["used_calls"] == 0
+    assert stats["wasted_calls"] == 3
+    assert stats["saved_rounds"] == 0
+
+
+def test_pooled_question_is_served_clean_and_counted_as_saved():
+    store = InMemoryStateStore()
+    speculation.record_leftover(store, make_candidate(2, passed=True), 3)
+
+    assert speculation.take_pooled(store, "3", "Fractions", ["question 2"]) is None
+    served = speculation.take_pooled(store, "3", "Fractions", [])
+
+    assert set(speculation.POOLED_FIELDS) <= set(served)
+    assert "request_id" not in served
+    assert "question_history" not in served
+    assert "llm_calls" not in served
+    assert served["revision_count"] == 0
+    assert served["message_history"] == ["Served from the question pool."]
+    stats = speculation.speculation_stats(store)
+    assert stats["pool_hits"] == 1
+    assert stats["saved_rounds"] == 1
+    assert stats["saved_calls"] == speculation.PASSING_ROUND_CALLS
+    assert stats["pool_size"] == 0
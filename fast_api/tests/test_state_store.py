@@ -0,0 +1,122 @@
+import threading
+import pytest
+from app.helpers.state_store import InMemoryStateStore, SQLiteStateStore, StateStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / "state.db"))
+
+
+def test_backend_missing_a_method_fails_on_creation():
+    class Incomplete(StateStore):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_history_filters_newest_first(store):
+    store.record_history("ana", "3", "Fractions", "q1", {"answer": "1"})
+    store.record_history("ben", "3", "Fractions", "q2", {})
+    store.record_history("ana", "4", "Geometry", "q3", {})
+    store.record_history("ana", "3", "Fractions", "q4", {})
+
+    assert [r["question"] for r in store.history(student="ana")] == ["q4", "q3", "q1"]
+    assert [
+        r["question"]
+        for r in store.history(student="ana", grade="3", concept="Fractions")
+    ] == ["q4", "q1"]
+    assert [
+        r["question"] for r in store.history(grade="3", concept="Fractions")
+    ] == ["q4", "q2", "q1"]
+    assert [r["question"] for r in store.history(grade="4")] == ["q3"]
+    assert [r["question"] for r in store.history(limit=2)] == ["q4", "q3"]
+    assert store.history(student="ana", concept="Fractions")[-1]["payload"] == {
+        "answer": "1"
+    }
+    assert store.history(student="nobody") == []
+
+
+def test_answers_record_outcome(store):
+    store.record_answer("ana", "3", "Fractions", "q1", "1/2", True)
+    store.record_answer("ana", "3", "Fractions", "q2", "3", False)
+    store.record_answer("ben", "3", "Fractions", "q1", "1/4", False)
+
+    answers = store.answers(student="ana", grade="3", concept="Fractions")
+    assert [(a["question"], a["payload"]["correct"]) for a in answers] == [
+        ("q2", False),
+        ("q1", True),
+    ]
+    assert len(store.answers(grade="3", concept="Fractions")) == 3
+    # Answers are kept apart from the served question history.
+    assert store.history(student="ana") == []
+
+
+def test_pop_pool_skips_excluded_and_is_fifo(store):
+    store.push_pool("3", "Fractions", "p1", {"final_question": "p1"})
+    store.push_pool("3", "Fractions", "p2", {"final_question": "p2"})
+    store.push_pool("4", "Geometry", "p3", {"final_question": "p3"})
+
+    assert store.pool_size() == 3
+    assert store.pop_pool("3", "Fractions", exclude=["p1"]) == {"final_question": "p2"}
+    assert store.pop_pool("3", "Fractions") == {"final_question": "p1"}
+    assert store.pop_pool("3", "Fractions") is None
+    assert store.pool_size() == 1
+
+
+def test_pop_pool_hands_each_item_out_once(store):
+    for i in range(50):
+        store.push_pool("3", "Fractions", f"p{i}", {"i": i})
+
+    popped = []
+
+    def worker():
+        while True:
+            item = store.pop_pool("3", "Fractions")
+            if item is None:
+                return
+            popped.append(item["i"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(popped) == list(range(50))
+
+
+def test_cache_ttl(store):
+    store.set_cache("fresh", {"concepts": [1, 2]}, ttl=60)
+    store.set_cache("expired", [1], ttl=-1)
+    store.set_cache("forever", "x")
+
+    assert store.get_cache("fresh") == {"concepts": [1, 2]}
+    assert store.get_cache("expired") is None
+    assert store.get_cache("forever") == "x"
+    assert store.get_cache("missing") is None
+
+
+def test_counters(store):
+    store.increment("rounds")
+    store.increment("rounds", 4)
+    store.increment("pooled")
+
+    assert store.counters() == {"rounds": 5, "pooled": 1}
+
+
+def test_sqlite_state_is_shared_between_store_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteStateStore(path), SQLiteStateStore(path)
+
+    first.record_history("ana", "3", "Fractions", "q1", {})
+    first.increment("rounds")
+    first.push_pool("3", "Fractions", "p1", {"final_question": "p1"})
+
+    assert [r["question"] for r in second.history(student="ana")] == ["q1"]
+    assert second.counters() == {"rounds": 1}
+    assert second.pop_pool("3", "Fractions") == {"final_question": "p1"}
+    assert first.pop_pool("3", "Fractions") is None
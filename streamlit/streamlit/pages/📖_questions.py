@@ -4,6 +4,7 @@ import os
 
 from utils.api_connector import (
     ai_chat_agent_get_question,
+    record_student_answer,
 )
 
 if "session_id" not in st.session_state:
@@ -53,6 +54,13 @@ else:
     )
     answer_btn = st.button("Submit Answer", type="primary")
     if answer_btn:
+        record_student_answer(
+            user_dict=user_dict,
+            math_info=concept_dict,
+            question=problem_name,
+            selected_answer=possible_answers_radio,
+            correct_answer=resp_dict["answer"],
+        )
         if str(possible_answers_radio) == str(resp_dict["answer"]):
             st.write("Correct!")
             st.balloons()
@@ -2,26 +2,78 @@ import requests
 import os
 import streamlit as st
 import json
+import time
+import uuid
+from typing import Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+def post_to_backend(api_path: str, query: dict) -> dict:
+    """Post a query to the backend, tagged with a request id for tracing."""
+    BACKEND_HOST = os.getenv("BACKEND_HOST")
+    api_url = f"{BACKEND_HOST}{api_path}"
+
+    request_id = uuid.uuid4().hex
+    start = time.time()
+    response, error = None, None
+    try:
+        response = requests.post(
+            api_url,
+            json=query,
+            headers={"Content-Type": "application/json", REQUEST_ID_HEADER: request_id},
+        )
+    except requests.RequestException as e:
+        error = repr(e)
+        raise
+    finally:
+        status = response.status_code if response is not None else None
+        record_client_span(request_id, api_path, start, status, error)
+    if response.status_code != 200:
+        raise ValueError(f"Error: {response.status_code} (request id {request_id})")
+    return response.json()
+
+
+def record_client_span(
+    request_id: str,
+    api_path: str,
+    start: float,
+    status: Optional[int],
+    error: Optional[str] = None,
+):
+    """Append the client side timing in the same format as the backend spans."""
+    duration_ms = round((time.time() - start) * 1000, 2)
+    trace_path = os.getenv("TRACE_EXPORT_PATH", "traces/spans.jsonl")
+    if not trace_path:
+        return
+    record = {
+        "trace_id": request_id,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": None,
+        "name": f"client POST /{api_path}",
+        "start": start,
+        "duration_ms": duration_ms,
+        "attributes": {"status_code": status},
+        "error": error,
+        "pid": os.getpid(),
+    }
+    if os.path.dirname(trace_path):
+        os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+    with open(trace_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
 
 
 # step 1
 @st.cache_data(ttl=24 * 24 * 1)
 def getting_key_math_concepts(question: str, user_dict: dict) -> dict:
     """Chat with the AI."""
-    BACKEND_HOST = os.getenv("BACKEND_HOST")
     api_path = "v1/genai/ai_chat_get_key_concepts/"
-    api_url = f"{BACKEND_HOST}{api_path}"
 
     query = {
         "question": json.dumps(question),
         "user_dict": json.dumps(user_dict),
     }
-    response = requests.post(
-        api_url, json=query, headers={"Content-Type": "application/json"}
-    )
-    if response.status_code != 200:
-        raise ValueError(f"Error: {response.status_code}")
-    return response.json()
+    return post_to_backend(api_path, query)
 
 
 # step 2
@@ -29,18 +81,32 @@ def ai_chat_agent_get_question(
     question_history: str, user_dict: dict, math_info: dict
 ) -> dict:
     """Get a math word problem question based on Grade, Topic."""
-    BACKEND_HOST = os.getenv("BACKEND_HOST")
     api_path = "v1/genai/ai_chat_agent_get_question/"
-    api_url = f"{BACKEND_HOST}{api_path}"
 
     query = {
         "question_history": json.dumps(question_history),
         "user_dict": json.dumps(user_dict),
         "math_info": json.dumps(math_info),
     }
-    response = requests.post(
-        api_url, json=query, headers={"Content-Type": "application/json"}
-    )
-    if response.status_code != 200:
-        raise ValueError(f"Error: {response.status_code}")
-    return response.json()
+    return post_to_backend(api_path, query)
+
+
+# step 3
+def record_student_answer(
+    user_dict: dict, math_info: dict, question: str, selected_answer, correct_answer
+) -> dict:
+    """Record the student's answer so progress is kept on the backend."""
+    api_path = "v1/genai/record_answer/"
+
+    query = {
+        "user_dict": json.dumps(user_dict),
+        "math_info": json.dumps(math_info),
+        "answer": json.dumps(
+            {
+                "question": question,
+                "selected_answer": selected_answer,
+                "correct_answer": correct_answer,
+            }
+        ),
+    }
+    return post_to_backend(api_path, query)
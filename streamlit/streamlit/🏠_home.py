@@ -57,7 +57,9 @@ def main():
         ],
     )
 
-    user_dict = {"user": "test_user", "grade": grade_dropdown}
+    student_name = st.sidebar.text_input("Student Name", value="test_user")
+
+    user_dict = {"user": student_name or "test_user", "grade": grade_dropdown}
 
     get_key_concepts_button = st.sidebar.button("Get Started", type="primary")
     if get_key_concepts_button: